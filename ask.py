@@ -6,184 +6,635 @@ Supports: Gemini, OpenAI, Anthropic Claude, Groq, and more
 
 import os
 import sys
+import atexit
 import json
+import time
+import sqlite3
+import hashlib
+import threading
 import argparse
+from collections import deque
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator, Tuple
 
+# Config (de)serialization: orjson when installed, stdlib json otherwise
 try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
+    import orjson
+    
+    _loads = orjson.loads
+    
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    
+    def _dumps_line(obj) -> bytes:
+        return orjson.dumps(obj) + b"\n"
 except ImportError:
-    GEMINI_AVAILABLE = False
+    _loads = json.loads
+    
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2).encode()
+    
+    def _dumps_line(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode() + b"\n"
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+# Environment variable holding each provider's API key
+_PROVIDER_ENV = (
+    ("gemini", "GEMINI_API_KEY"),
+    ("openai", "OPENAI_API_KEY"),
+    ("anthropic", "ANTHROPIC_API_KEY"),
+    ("groq", "GROQ_API_KEY"),
+)
 
-try:
-    from anthropic import Anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
+# Parsed config file and its mtime, keyed by path, so unchanged files aren't reparsed
+_CONFIG_CACHE: Dict[str, Tuple[float, Dict]] = {}
 
-try:
-    from groq import Groq
-    GROQ_AVAILABLE = True
-except ImportError:
-    GROQ_AVAILABLE = False
+# Longest excerpt kept per message when older turns are rolled into the summary
+SUMMARY_EXCERPT_CHARS = 200
+
+# Streamed output is flushed on newlines and at least this often (seconds)
+STREAM_FLUSH_INTERVAL = 0.05
+
+# Conversation log turns buffered before the file is flushed
+LOG_FLUSH_TURNS = 8
+
+
+def _read_config(path: Path) -> Dict:
+    """Parsed config file (empty if missing), reparsed only when its mtime changes"""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return {}
+    cached = _CONFIG_CACHE.get(str(path))
+    if cached is None or cached[0] != st.st_mtime:
+        cached = _CONFIG_CACHE[str(path)] = (st.st_mtime, _loads(path.read_bytes()))
+    return dict(cached[1])
+
+
+def _write_config(path: Path, data: Dict):
+    """Atomically replace the config file, readable only by the owner"""
+    _CONFIG_CACHE.pop(str(path), None)
+    
+    # Write a temp file and rename it so an interrupted write can't truncate the config
+    tmp = path.with_suffix(".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(_dumps(data))
+    os.chmod(tmp, 0o600)  # Secure the config file
+    os.replace(tmp, path)
+
+
+def _estimate_tokens(msg: Dict) -> int:
+    """Rough token count for a message (~4 characters per token)"""
+    return len(msg["content"]) // 4
+
+
+def _excerpt(text: str, limit: int = SUMMARY_EXCERPT_CHARS) -> str:
+    """Shorten text to its first and last sentences"""
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    sentences = text.split(". ")
+    if len(sentences) > 1:
+        text = f"{sentences[0]}. ... {sentences[-1]}"
+    if len(text) > limit:
+        text = text[:limit - 3] + "..."
+    return text
 
 
 class AIClient:
     """Multi-provider AI client"""
     
-    def __init__(self, provider: str = "groq", model: Optional[str] = None):
+    __slots__ = (
+        "provider", "model", "async_mode", "client", "config_file", "config",
+        "conversation_history", "summary_lines", "max_turns", "token_budget",
+        "cache_db", "cache_ttl", "_http", "_sys_msg", "_summary_msg",
+        "_chat_fn", "_stream_fn", "_achat_fn", "_log", "_log_cctx", "_log_pending",
+    )
+    
+    def __init__(self, provider: str = "groq", model: Optional[str] = None, async_mode: bool = False,
+                 max_turns: int = 40, token_budget: int = 8000, use_cache: bool = True,
+                 cache_ttl: Optional[float] = 3600, log_path: Optional[str] = None):
+        if max_turns < 1:
+            raise ValueError(f"max_turns must be at least 1, got {max_turns}")
         self.provider = provider.lower()
         self.model = model
-        self.conversation_history: List[Dict] = []
+        self.async_mode = async_mode
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        # One turn is a user message plus its reply
+        self.conversation_history = deque(maxlen=2 * max_turns)
+        # Excerpts of turns rolled out of history, one entry per user/assistant turn
+        self.summary_lines: List[str] = []
+        # Message dicts reused across turns until their content changes
+        self._sys_msg: Optional[Dict] = None
+        self._summary_msg: Optional[Dict] = None
+        self._http = None
+        self.cache_ttl = cache_ttl
+        self.cache_db = None
+        self._log = None
         self.config_file = Path.home() / ".ai_cli_config.json"
-        self.load_config()
-        self.initialize_client()
+        try:
+            if use_cache:
+                self._open_cache()
+            if log_path:
+                self._open_log(log_path)
+            self.load_config()
+            self.initialize_client()
+        except BaseException:
+            self.close()  # The caller never gets the client, so release what was opened
+            raise
+    
+    def _open_cache(self):
+        """Open the reply cache, leaving caching off if the file can't be used"""
+        cache_file = str(Path.home() / ".ai_cli_cache.sqlite")
+        try:
+            # Replies may contain private data, so create the file owner-only
+            os.close(os.open(cache_file, os.O_WRONLY | os.O_CREAT, 0o600))
+            os.chmod(cache_file, 0o600)
+            self.cache_db = sqlite3.connect(cache_file)
+            self.cache_db.execute(
+                "CREATE TABLE IF NOT EXISTS responses(key TEXT PRIMARY KEY, reply TEXT, ts REAL)"
+            )
+            if self.cache_ttl is not None:
+                # Expired replies are never served, so don't keep them on disk
+                with self.cache_db:
+                    self.cache_db.execute("DELETE FROM responses WHERE ts < ?", (time.time() - self.cache_ttl,))
+        except (sqlite3.Error, OSError):
+            # Unwritable or full home; run without a cache rather than failing
+            if self.cache_db is not None:
+                self.cache_db.close()
+            self.cache_db = None
     
     def load_config(self):
         """Load API keys from config file or environment"""
-        self.config = {}
-        if self.config_file.exists():
-            with open(self.config_file, 'r') as f:
-                self.config = json.load(f)
+        self.config = _read_config(self.config_file)
         
         # Load from environment if not in config
-        self.config.setdefault('gemini_api_key', os.getenv('GEMINI_API_KEY', ''))
-        self.config.setdefault('openai_api_key', os.getenv('OPENAI_API_KEY', ''))
-        self.config.setdefault('anthropic_api_key', os.getenv('ANTHROPIC_API_KEY', ''))
-        self.config.setdefault('groq_api_key', os.getenv('GROQ_API_KEY', ''))
+        for provider, env_var in _PROVIDER_ENV:
+            self.config.setdefault(f"{provider}_api_key", os.environ.get(env_var, ''))
     
     def save_config(self):
         """Save configuration to file"""
-        with open(self.config_file, 'w') as f:
-            json.dump(self.config, f, indent=2)
-        os.chmod(self.config_file, 0o600)  # Secure the config file
+        _write_config(self.config_file, self.config)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """Close the response cache, conversation log and pooled HTTP connection
+
+        In async mode the connection pool can only be closed here when no event
+        loop is running; from inside a loop use aclose() instead.
+        """
+        if self._http is not None:
+            if not self.async_mode:
+                self._http.close()
+                self._http = None
+            else:
+                import asyncio
+                
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    asyncio.run(self.aclose())
+        if self.cache_db is not None:
+            self.cache_db.close()
+            self.cache_db = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+    
+    async def aclose(self):
+        """Close the pooled HTTP connection (async mode)"""
+        if self._http is not None and self.async_mode:
+            await self._http.aclose()
+            self._http = None
+    
+    def _http_client(self):
+        """Keep-alive HTTP client shared by every request this client makes"""
+        import httpx
+        
+        try:
+            import h2  # httpx needs it for HTTP/2
+            http2 = True
+        except ImportError:
+            http2 = False
+        
+        client_cls = httpx.AsyncClient if self.async_mode else httpx.Client
+        self._http = client_cls(
+            http2=http2,
+            # Match the SDKs' own 600s default: non-streamed replies send nothing until done
+            timeout=httpx.Timeout(600, connect=10),
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40)
+        )
+        return self._http
     
     def initialize_client(self):
-        """Initialize the appropriate AI client"""
+        """Initialize the appropriate AI client and select its request methods"""
+        init = _PROVIDER_INIT.get(self.provider)
+        if init is None:
+            raise ValueError(f"Unknown provider: {self.provider}")
+        init(self)
+        
+        # Groq serves the OpenAI chat completions API
+        self._chat_fn = {"gemini": self._chat_gemini, "openai": self._chat_openai,
+                         "anthropic": self._chat_anthropic, "groq": self._chat_openai}[self.provider]
+        self._stream_fn = {"gemini": self._stream_gemini, "openai": self._stream_openai,
+                           "anthropic": self._stream_anthropic, "groq": self._stream_openai}[self.provider]
+        self._achat_fn = {"gemini": self._achat_gemini, "openai": self._achat_openai,
+                          "anthropic": self._achat_anthropic, "groq": self._achat_openai}[self.provider]
+    
+    def _init_gemini(self):
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            raise ImportError("google-generativeai not installed. Run: pip install google-generativeai")
+        api_key = self.config.get('gemini_api_key')
+        if not api_key:
+            raise ValueError("Gemini API key not found. Set GEMINI_API_KEY or run --configure")
+        genai.configure(api_key=api_key)
+        self.model = self.model or "gemini-pro"
+        self.client = genai.GenerativeModel(self.model)
+    
+    def _init_openai(self):
+        try:
+            from openai import OpenAI, AsyncOpenAI
+        except ImportError:
+            raise ImportError("openai not installed. Run: pip install openai")
+        api_key = self.config.get('openai_api_key')
+        if not api_key:
+            raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY or run --configure")
+        client_cls = AsyncOpenAI if self.async_mode else OpenAI
+        self.client = client_cls(api_key=api_key, http_client=self._http_client())
+        self.model = self.model or "gpt-4-turbo-preview"
+    
+    def _init_anthropic(self):
+        try:
+            from anthropic import Anthropic, AsyncAnthropic
+        except ImportError:
+            raise ImportError("anthropic not installed. Run: pip install anthropic")
+        api_key = self.config.get('anthropic_api_key')
+        if not api_key:
+            raise ValueError("Anthropic API key not found. Set ANTHROPIC_API_KEY or run --configure")
+        client_cls = AsyncAnthropic if self.async_mode else Anthropic
+        self.client = client_cls(api_key=api_key, http_client=self._http_client())
+        self.model = self.model or "claude-3-5-sonnet-20241022"
+    
+    def _init_groq(self):
+        try:
+            from groq import Groq, AsyncGroq
+        except ImportError:
+            raise ImportError("groq not installed. Run: pip install groq")
+        api_key = self.config.get('groq_api_key')
+        if not api_key:
+            raise ValueError("Groq API key not found. Set GROQ_API_KEY or run --configure")
+        client_cls = AsyncGroq if self.async_mode else Groq
+        self.client = client_cls(api_key=api_key, http_client=self._http_client())
+        self.model = self.model or "llama-3.3-70b-versatile"
+    
+    def _trim_history(self, message: str):
+        """Roll the oldest turns into the summary until the next request fits
+
+        Makes room for the new user/assistant pair (so the deque never evicts
+        silently) and keeps the estimated prompt size under token_budget.
+        """
+        history = self.conversation_history
+        budget = self.token_budget - _estimate_tokens({"content": message})
+        used = sum(_estimate_tokens(m) for m in history)
+        used += sum(len(line) for line in self.summary_lines) // 4
+        
+        # Never leave history starting mid-turn (Anthropic requires a user message first)
+        while history and (len(history) + 2 > history.maxlen or used >= budget
+                           or history[0]["role"] != "user"):
+            old = history.popleft()
+            line = f"{old['role']}: {_excerpt(old['content'])}"
+            if old["role"] == "user" or not self.summary_lines:
+                self.summary_lines.append(line)
+            else:
+                self.summary_lines[-1] += "\n" + line
+            self._summary_msg = None
+            used += len(line) // 4 - _estimate_tokens(old)
+        
+        # Keep the summary itself bounded: the first turn (where early facts are usually
+        # set up) always stays, then the oldest whole turns after it are dropped
+        while len(self.summary_lines) > 1 and used >= budget:
+            used -= len(self.summary_lines.pop(1)) // 4
+            self._summary_msg = None
+    
+    def _summary_message(self) -> Optional[Dict]:
+        """System message summarizing turns dropped from history, if any"""
+        if self._summary_msg is None and self.summary_lines:
+            content = "Summary of earlier turns:\n" + "\n".join(self.summary_lines)
+            self._summary_msg = {"role": "system", "content": content}
+        return self._summary_msg
+    
+    def _summary_text(self) -> Optional[str]:
+        """Summary of turns dropped from history, if any"""
+        summary = self._summary_message()
+        return summary["content"] if summary else None
+    
+    def _system_message(self, system_prompt: Optional[str]) -> Optional[Dict]:
+        """System prompt as a message, rebuilt only when the prompt changes"""
+        if not system_prompt:
+            return None
+        if self._sys_msg is None or self._sys_msg["content"] != system_prompt:
+            self._sys_msg = {"role": "system", "content": system_prompt}
+        return self._sys_msg
+    
+    def _openai_messages(self, system_prompt: Optional[str], user_msg: Dict) -> List[Dict]:
+        """Request messages for the chat completions API, built as a single list"""
+        head = (self._system_message(system_prompt), self._summary_message())
+        return [*filter(None, head), *self.conversation_history, user_msg]
+    
+    def _anthropic_system(self, system_prompt: Optional[str]) -> Optional[str]:
+        """Anthropic takes no system messages in history, so fold the summary in"""
+        summary = self._summary_text()
+        if summary and system_prompt:
+            return f"{system_prompt}\n\n{summary}"
+        return summary or system_prompt
+    
+    def _cache_key(self, message: str, system_prompt: Optional[str], history: List[Dict]) -> Optional[str]:
+        """Hash of everything that determines the reply to a request (None when caching is off)"""
+        if self.cache_db is None:
+            return None
+        payload = json.dumps([self.provider, self.model, system_prompt, history, message], sort_keys=True)
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+    
+    def _conversation_key(self, message: str, system_prompt: Optional[str]) -> Optional[str]:
+        """Cache key for a message sent in the context of the current conversation"""
+        summary = self._summary_message()
+        history = [summary, *self.conversation_history] if summary else list(self.conversation_history)
+        return self._cache_key(message, system_prompt, history)
+    
+    def _cache_get(self, key: Optional[str]) -> Optional[str]:
+        """Cached reply for key, unless missing or older than cache_ttl"""
+        if key is None:
+            return None
+        row = self.cache_db.execute("SELECT reply, ts FROM responses WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return None
+        reply, ts = row
+        if self.cache_ttl is not None and time.time() - ts > self.cache_ttl:
+            return None
+        return reply
+    
+    def _cache_put(self, key: Optional[str], reply: str):
+        """Store a reply in the cache"""
+        if key is None:
+            return
+        with self.cache_db:
+            self.cache_db.execute(
+                "INSERT OR REPLACE INTO responses(key, reply, ts) VALUES (?, ?, ?)",
+                (key, reply, time.time())
+            )
+    
+    def _open_log(self, log_path: str):
+        """Append turns to log_path as zstd-compressed JSON lines"""
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstandard not installed. Run: pip install zstandard")
+        self._log_cctx = zstandard.ZstdCompressor(level=3)
+        self._log = open(log_path, 'ab')
+        self._log_pending = 0
+    
+    def _log_turn(self, message: str, reply: str):
+        """Write one turn to the conversation log as its own zstd frame"""
+        if self._log is None:
+            return
+        entry = {"ts": time.time(), "provider": self.provider, "model": self.model,
+                 "user": message, "assistant": reply}
+        self._log.write(self._log_cctx.compress(_dumps_line(entry)))
+        self._log_pending += 1
+        if self._log_pending >= LOG_FLUSH_TURNS:
+            self._log.flush()
+            self._log_pending = 0
+    
+    def _remember(self, message: str, reply: str):
+        """Record a cached exchange in history as if it had been sent"""
         if self.provider == "gemini":
-            if not GEMINI_AVAILABLE:
-                raise ImportError("google-generativeai not installed. Run: pip install google-generativeai")
-            api_key = self.config.get('gemini_api_key')
-            if not api_key:
-                raise ValueError("Gemini API key not found. Set GEMINI_API_KEY or run --configure")
-            genai.configure(api_key=api_key)
-            self.model = self.model or "gemini-pro"
-            self.client = genai.GenerativeModel(self.model)
-            
-        elif self.provider == "openai":
-            if not OPENAI_AVAILABLE:
-                raise ImportError("openai not installed. Run: pip install openai")
-            api_key = self.config.get('openai_api_key')
-            if not api_key:
-                raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY or run --configure")
-            self.client = OpenAI(api_key=api_key)
-            self.model = self.model or "gpt-4-turbo-preview"
-            
-        elif self.provider == "anthropic":
-            if not ANTHROPIC_AVAILABLE:
-                raise ImportError("anthropic not installed. Run: pip install anthropic")
-            api_key = self.config.get('anthropic_api_key')
-            if not api_key:
-                raise ValueError("Anthropic API key not found. Set ANTHROPIC_API_KEY or run --configure")
-            self.client = Anthropic(api_key=api_key)
-            self.model = self.model or "claude-3-5-sonnet-20241022"
-            
-        elif self.provider == "groq":
-            if not GROQ_AVAILABLE:
-                raise ImportError("groq not installed. Run: pip install groq")
-            api_key = self.config.get('groq_api_key')
-            if not api_key:
-                raise ValueError("Groq API key not found. Set GROQ_API_KEY or run --configure")
-            self.client = Groq(api_key=api_key)
-            self.model = self.model or "llama-3.3-70b-versatile"
+            return  # Gemini requests are sent without history
+        self._trim_history(message)
+        self.conversation_history.append({"role": "user", "content": message})
+        self.conversation_history.append({"role": "assistant", "content": reply})
+    
+    def chat(self, message: str, system_prompt: Optional[str] = None) -> str:
+        """Send a message and get response, answering from the cache when possible"""
+        key = self._conversation_key(message, system_prompt)
+        reply = self._cache_get(key)
+        if reply is not None:
+            self._remember(message, reply)
+        else:
+            reply = self._chat_fn(message, system_prompt)
+            self._cache_put(key, reply)
+        self._log_turn(message, reply)
+        return reply
+    
+    def _chat_gemini(self, message: str, system_prompt: Optional[str] = None) -> str:
+        if system_prompt:
+            # For Gemini, prepend system prompt to first message
+            if not self.conversation_history:
+                message = f"{system_prompt}\n\n{message}"
+        
+        response = self.client.generate_content(message)
+        return response.text
+    
+    def _chat_openai(self, message: str, system_prompt: Optional[str] = None) -> str:
+        self._trim_history(message)
+        user_msg = {"role": "user", "content": message}
+        messages = self._openai_messages(system_prompt, user_msg)
+        
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages
+        )
+        reply = response.choices[0].message.content
+        
+        # Update history
+        self.conversation_history.append(user_msg)
+        self.conversation_history.append({"role": "assistant", "content": reply})
+        
+        return reply
+    
+    def _chat_anthropic(self, message: str, system_prompt: Optional[str] = None) -> str:
+        self._trim_history(message)
+        self.conversation_history.append({"role": "user", "content": message})
+        
+        kwargs = {"model": self.model, "max_tokens": 4096, "messages": list(self.conversation_history)}
+        system = self._anthropic_system(system_prompt)
+        if system:
+            kwargs["system"] = system
+        
+        response = self.client.messages.create(**kwargs)
+        reply = response.content[0].text
+        
+        self.conversation_history.append({"role": "assistant", "content": reply})
+        
+        return reply
+    
+    def chat_stream(self, message: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        """Send a message and yield the response as it is generated
 
+        A cached reply is yielded in one piece; only completed streams are cached.
+        """
+        key = self._conversation_key(message, system_prompt)
+        reply = self._cache_get(key)
+        if reply is not None:
+            self._remember(message, reply)
+            yield reply
         else:
-            raise ValueError(f"Unknown provider: {self.provider}")
+            parts = []
+            for token in self._stream_fn(message, system_prompt):
+                parts.append(token)
+                yield token
+            reply = "".join(parts)
+            self._cache_put(key, reply)
+        self._log_turn(message, reply)
     
-    def chat(self, message: str, system_prompt: Optional[str] = None) -> str:
-        """Send a message and get response"""
-        if self.provider == "gemini":
-            if system_prompt:
-                # For Gemini, prepend system prompt to first message
-                if not self.conversation_history:
-                    message = f"{system_prompt}\n\n{message}"
-            
-            response = self.client.generate_content(message)
-            return response.text
-            
-        elif self.provider == "openai":
-            messages = []
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            messages.extend(self.conversation_history)
-            messages.append({"role": "user", "content": message})
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages
-            )
-            reply = response.choices[0].message.content
-            
-            # Update history
-            self.conversation_history.append({"role": "user", "content": message})
-            self.conversation_history.append({"role": "assistant", "content": reply})
-            
-            return reply
-            
-        elif self.provider == "anthropic":
-            self.conversation_history.append({"role": "user", "content": message})
-            
-            kwargs = {"model": self.model, "max_tokens": 4096, "messages": self.conversation_history}
-            if system_prompt:
-                kwargs["system"] = system_prompt
-            
-            response = self.client.messages.create(**kwargs)
-            reply = response.content[0].text
-            
-            self.conversation_history.append({"role": "assistant", "content": reply})
-            
-            return reply
-            
-        elif self.provider == "groq":
-            messages = []
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            messages.extend(self.conversation_history)
-            messages.append({"role": "user", "content": message})
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages
-            )
-            reply = response.choices[0].message.content
-            
-            # Update history
-            self.conversation_history.append({"role": "user", "content": message})
-            self.conversation_history.append({"role": "assistant", "content": reply})
-            
-            return reply
+    # Streaming methods only update history once the stream completes, so an
+    # interrupted reply leaves the conversation untouched.
+    
+    def _stream_gemini(self, message: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        if system_prompt:
+            # For Gemini, prepend system prompt to first message
+            if not self.conversation_history:
+                message = f"{system_prompt}\n\n{message}"
+        
+        for chunk in self.client.generate_content(message, stream=True):
+            yield chunk.text
+    
+    def _stream_openai(self, message: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        self._trim_history(message)
+        user_msg = {"role": "user", "content": message}
+        messages = self._openai_messages(system_prompt, user_msg)
+        
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True
+        )
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content or ""
+            parts.append(token)
+            yield token
+        
+        # Update history
+        self.conversation_history.append(user_msg)
+        self.conversation_history.append({"role": "assistant", "content": "".join(parts)})
+    
+    def _stream_anthropic(self, message: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        self._trim_history(message)
+        user_msg = {"role": "user", "content": message}
+        messages = [*self.conversation_history, user_msg]
+        
+        kwargs = {"model": self.model, "max_tokens": 4096, "messages": messages}
+        system = self._anthropic_system(system_prompt)
+        if system:
+            kwargs["system"] = system
+        
+        parts = []
+        with self.client.messages.stream(**kwargs) as stream:
+            for token in stream.text_stream:
+                parts.append(token)
+                yield token
+        
+        # Update history
+        self.conversation_history.append(user_msg)
+        self.conversation_history.append({"role": "assistant", "content": "".join(parts)})
+    
+    async def achat(self, message: str, system_prompt: Optional[str] = None) -> str:
+        """Send a single message asynchronously (requires async_mode=True)
+
+        Each call is independent: conversation history is neither sent nor
+        updated, since concurrent calls would otherwise race on it.
+        """
+        key = self._cache_key(message, system_prompt, [])
+        reply = self._cache_get(key)
+        if reply is None:
+            reply = await self._achat_fn(message, system_prompt)
+            self._cache_put(key, reply)
+        self._log_turn(message, reply)
+        return reply
+    
+    async def _achat_gemini(self, message: str, system_prompt: Optional[str] = None) -> str:
+        if system_prompt:
+            message = f"{system_prompt}\n\n{message}"
+        
+        response = await self.client.generate_content_async(message)
+        return response.text
+    
+    async def _achat_openai(self, message: str, system_prompt: Optional[str] = None) -> str:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": message})
+        
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages
+        )
+        return response.choices[0].message.content
+    
+    async def _achat_anthropic(self, message: str, system_prompt: Optional[str] = None) -> str:
+        kwargs = {"model": self.model, "max_tokens": 4096,
+                  "messages": [{"role": "user", "content": message}]}
+        if system_prompt:
+            kwargs["system"] = system_prompt
+        
+        response = await self.client.messages.create(**kwargs)
+        return response.content[0].text
+    
+    async def achat_many(self, messages: List[str], system_prompt: Optional[str] = None,
+                         concurrency: int = 20) -> List:
+        """Send many messages concurrently, at most `concurrency` in flight
+
+        Returns replies in input order; a failed request yields its exception
+        instead of a reply so one error doesn't abort the whole batch.
+        """
+        import asyncio
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def bounded(message: str) -> str:
+            async with semaphore:
+                return await self.achat(message, system_prompt)
+        
+        return await asyncio.gather(*[bounded(m) for m in messages], return_exceptions=True)
     
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self.summary_lines = []
+        self._summary_msg = None
+
 
+# Client setup per provider, looked up once in AIClient.initialize_client
+_PROVIDER_INIT = {
+    "gemini": AIClient._init_gemini,
+    "openai": AIClient._init_openai,
+    "anthropic": AIClient._init_anthropic,
+    "groq": AIClient._init_groq,
+}
 
-def configure_api_keys():
-    """Interactive configuration of API keys"""
+
+def configure_api_keys(updates: Optional[Dict[str, str]] = None):
+    """Configure API keys interactively, or non-interactively from `updates`"""
     config_file = Path.home() / ".ai_cli_config.json"
-    config = {}
     
-    if config_file.exists():
-        with open(config_file, 'r') as f:
-            config = json.load(f)
+    if updates is not None:
+        config = _read_config(config_file)
+        config.update(updates)
+        _write_config(config_file, config)
+        print(f"✓ Configuration saved to {config_file}")
+        return
+    
+    config = _read_config(config_file)
     
     print("=== AI CLI Configuration ===\n")
     print("Enter your API keys (press Enter to skip):\n")
@@ -204,15 +655,131 @@ def configure_api_keys():
     if groq_key:
         config['groq_api_key'] = groq_key
     
-    with open(config_file, 'w') as f:
-        json.dump(config, f, indent=2)
-    os.chmod(config_file, 0o600)
+    _write_config(config_file, config)
     
     print(f"\n✓ Configuration saved to {config_file}")
 
 
+def positive_int(value: str) -> int:
+    """argparse type for integers >= 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def write_stream(tokens: Iterator[str]):
+    """Write streamed tokens to stdout's byte buffer, batching flushes"""
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:
+        for token in tokens:
+            sys.stdout.write(token)
+            sys.stdout.flush()
+        return
+    
+    sys.stdout.flush()  # Text already printed must come first
+    encoding = sys.stdout.encoding or "utf-8"
+    write, flush = out.write, out.flush
+    
+    # Flush from a background thread so buffered tokens still appear while the
+    # provider pauses between chunks; flushing an empty buffer costs no syscall
+    done = threading.Event()
+    
+    def flush_periodically():
+        try:
+            while not done.wait(STREAM_FLUSH_INTERVAL):
+                flush()
+        except OSError:
+            pass  # stdout closed; the final flush below reports it
+    
+    flusher = threading.Thread(target=flush_periodically, daemon=True)
+    flusher.start()
+    try:
+        for token in tokens:
+            write(token.encode(encoding, "replace"))
+            if "\n" in token:
+                flush()
+    finally:
+        done.set()
+        flusher.join()
+        flush()
+
+
+def batch_mode(client: AIClient, batch_file: str, system_prompt: Optional[str] = None,
+               concurrency: int = 20) -> int:
+    """Answer one prompt per line from a file (or stdin with '-') concurrently
+
+    Returns the number of prompts that failed; their errors go to stderr.
+    """
+    import asyncio
+    
+    if batch_file == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(batch_file, 'r') as f:
+            lines = f.read().splitlines()
+    prompts = [line.strip() for line in lines if line.strip()]
+    
+    async def run():
+        try:
+            return await client.achat_many(prompts, system_prompt, concurrency)
+        finally:
+            await client.aclose()
+    
+    # uvloop's event loop handles high-concurrency fan-out faster when installed
+    try:
+        import uvloop
+    except ImportError:
+        replies = asyncio.run(run())
+    else:
+        if hasattr(uvloop, "run"):
+            replies = uvloop.run(run())
+        else:
+            # uvloop < 0.18 has no run(); drive one of its loops directly
+            loop = uvloop.new_event_loop()
+            try:
+                replies = loop.run_until_complete(run())
+            finally:
+                loop.close()
+    
+    failures = 0
+    for prompt, reply in zip(prompts, replies):
+        print(f"\n You: {prompt}")
+        if isinstance(reply, Exception):
+            failures += 1
+            sys.stdout.flush()
+            print(f"\nError: {reply}", file=sys.stderr)
+        else:
+            print(f"\n  AI: {reply}")
+    return failures
+
+
 def interactive_mode(client: AIClient, system_prompt: Optional[str] = None):
     """Run interactive chat mode"""
+    # Line editing, arrow-key recall and Ctrl-R search for input(), persisted across sessions
+    try:
+        import readline
+    except ImportError:
+        pass
+    else:
+        history_file = str(Path.home() / ".ai_cli_history")
+        try:
+            readline.read_history_file(history_file)
+        except OSError:
+            pass  # No history yet
+        readline.set_history_length(1000)
+        
+        def save_history():
+            try:
+                # Prompts may contain private data, so keep the file owner-only
+                os.close(os.open(history_file, os.O_WRONLY | os.O_CREAT, 0o600))
+                os.chmod(history_file, 0o600)
+                readline.write_history_file(history_file)
+            except OSError:
+                pass  # Unwritable home; history just isn't saved
+        
+        atexit.register(save_history)
+    
     print(f"\n=== AI Chat ({client.provider.upper()} - {client.model}) ===")
     print("Type 'exit' or 'quit' to end, 'clear' to reset conversation\n")
     
@@ -232,8 +799,12 @@ def interactive_mode(client: AIClient, system_prompt: Optional[str] = None):
                 print("\n✓ Conversation cleared")
                 continue
             
-            response = client.chat(user_input, system_prompt)
-            print(f"\n  AI: {response}")
+            print("\n  AI: ", end="", flush=True)
+            try:
+                write_stream(client.chat_stream(user_input, system_prompt))
+            except KeyboardInterrupt:
+                print("\n\n[interrupted]", end="")
+            print()
             
         except KeyboardInterrupt:
             print("\n\nGoodbye!")
@@ -253,9 +824,13 @@ Examples:
   %(prog)s -p anthropic -m claude-opus-4      # Use Claude Opus
   %(prog)s "Write a function"                 # Quick query with Groq (default)
   %(prog)s --configure                        # Configure API keys
+  %(prog)s --set groq_api_key=gsk_...          # Set a key without prompting
   %(prog)s --system "You are a poet" -i       # Set system prompt
+  %(prog)s --batch prompts.txt                # Answer one prompt per line concurrently
 
 Providers: groq (default), gemini, openai, anthropic
+
+Batch mode uses uvloop for its event loop when installed (pip install uvloop).
         """
     )
     
@@ -267,24 +842,59 @@ Providers: groq (default), gemini, openai, anthropic
     parser.add_argument('-i', '--interactive', action='store_true',
                        help='Start interactive chat mode')
     parser.add_argument('-s', '--system', help='System prompt')
+    parser.add_argument('--max-turns', type=positive_int, default=40,
+                       help='Conversation turns kept verbatim before older ones are summarized (default: 40)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Always query the provider instead of reusing cached replies')
+    parser.add_argument('--cache-ttl', type=float, default=3600,
+                       help='Seconds a cached reply stays valid (default: 3600)')
+    parser.add_argument('--log', metavar='PATH',
+                       help='Append each turn to PATH as zstd-compressed JSON lines (read with: zstd -dc PATH)')
+    parser.add_argument('--batch', metavar='FILE',
+                       help="Answer one prompt per line from FILE concurrently ('-' for stdin)")
+    parser.add_argument('--concurrency', type=positive_int, default=20,
+                       help='Max concurrent requests in batch mode (default: 20)')
     parser.add_argument('--configure', action='store_true',
                        help='Configure API keys')
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE',
+                       help='Set an API key without prompting, e.g. groq_api_key=... (repeatable)')
     
     args = parser.parse_args()
     
+    if args.set:
+        if args.configure:
+            parser.error("--set and --configure cannot be used together")
+        known_keys = [f"{provider}_api_key" for provider, _ in _PROVIDER_ENV]
+        updates = {}
+        for item in args.set:
+            key, sep, value = item.partition('=')
+            key = key.strip()
+            if not sep or not key:
+                parser.error(f"--set expects KEY=VALUE, got: {item}")
+            if key not in known_keys:
+                parser.error(f"--set: unknown key '{key}' (choose from {', '.join(known_keys)})")
+            updates[key] = value.strip()
+        configure_api_keys(updates)
+        return
+    
     if args.configure:
         configure_api_keys()
         return
     
     try:
-        client = AIClient(provider=args.provider, model=args.model)
-        
-        if args.interactive or not args.query:
-            interactive_mode(client, args.system)
-        else:
-            query = ' '.join(args.query)
-            response = client.chat(query, args.system)
-            print(response)
+        with AIClient(provider=args.provider, model=args.model,
+                      async_mode=bool(args.batch), max_turns=args.max_turns,
+                      use_cache=not args.no_cache, cache_ttl=args.cache_ttl,
+                      log_path=args.log) as client:
+            if args.batch:
+                if batch_mode(client, args.batch, args.system, args.concurrency):
+                    sys.exit(1)
+            elif args.interactive or not args.query:
+                interactive_mode(client, args.system)
+            else:
+                query = ' '.join(args.query)
+                write_stream(client.chat_stream(query, args.system))
+                print()
             
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)